@@ -7,7 +7,7 @@ use std::fs;
 use std::io;
 use std::time::Duration;
 
-use anyhow::Result;
+use anyhow::{Context, Result, bail};
 use crossterm::ExecutableCommand;
 use crossterm::event::{self, Event, KeyCode, KeyEvent, KeyModifiers};
 use crossterm::terminal::{
@@ -15,7 +15,10 @@ use crossterm::terminal::{
 };
 use ratatui::backend::CrosstermBackend;
 
-use spi_master::{IrqWatcher, MAX_PAYLOAD, NUM_DEVICES, SpiMaster};
+use spi_master::{
+    DEFAULT_SPI_SPEED_HZ, IrqWatcher, MAX_PAYLOAD, MAX_SPI_SPEED_HZ, NUM_DEVICES, READ_SIZE,
+    SpiMaster,
+};
 use terminal::Terminal;
 use ui::StatusInfo;
 
@@ -24,9 +27,18 @@ const MAX_KB_TLV_DATA: usize = 16; // Device 2: keyboard — limits 6502-side re
 const MAX_NETBOOT_TLV_DATA: usize = 128; // Device 3: netboot — limits 6502-side read buffer requirements
 const LOG_CAPACITY: usize = 1000;
 const BUS_MAX_BUFFER_SIZE: u16 = 4096; // Per-device buffer capacity on Pico
+const IDLE_TIMEOUT: Duration = Duration::from_millis(50); // Max main-loop sleep without IRQ/input
+const TX_PACING: Duration = Duration::from_millis(10); // Max main-loop sleep while TX is queued
+const PICO_RX_RING_SIZE: usize = 8192; // SPI_SLAVE_RX_RING_SIZE on Pico; an overrun is fatal
+
+/// Pico RX-ring bytes left for the TX batch in one main-loop pass. The same
+/// pass may also leave drain_spi's last fused WRITE+REQUEST and READ unconsumed.
+const TX_RING_BUDGET: usize = PICO_RX_RING_SIZE - (3 + MAX_PAYLOAD + 1) - READ_SIZE;
+const TX_FRAMES_PER_PASS: usize = TX_RING_BUDGET / (3 + MAX_PAYLOAD); // 3: worst case ~7.7 KB per pass
 
 /// Parse a SPI payload containing complete TLV packets (no straddling).
-fn parse_tlv_payload(payload: &[u8]) -> Vec<(u8, Vec<u8>)> {
+/// Returned data slices borrow from `payload`.
+fn parse_tlv_payload(payload: &[u8]) -> Vec<(u8, &[u8])> {
     let mut msgs = Vec::new();
     let mut pos = 0;
     while pos + 2 <= payload.len() {
@@ -35,20 +47,36 @@ fn parse_tlv_payload(payload: &[u8]) -> Vec<(u8, Vec<u8>)> {
         if pos + 2 + length > payload.len() {
             break;
         }
-        msgs.push((device, payload[pos + 2..pos + 2 + length].to_vec()));
+        msgs.push((device, &payload[pos + 2..pos + 2 + length]));
         pos += 2 + length;
     }
     msgs
 }
 
+/// Format bytes as space-separated lowercase hex pairs.
+fn hex_bytes(data: &[u8]) -> String {
+    const HEX: &[u8; 16] = b"0123456789abcdef";
+    let mut out = String::with_capacity(data.len() * 3);
+    for (i, &b) in data.iter().enumerate() {
+        if i > 0 {
+            out.push(' ');
+        }
+        out.push(HEX[(b >> 4) as usize] as char);
+        out.push(HEX[(b & 0x0F) as usize] as char);
+    }
+    out
+}
+
 struct App {
     master: SpiMaster,
     irq: IrqWatcher,
     terminal: Terminal,
-    log: Vec<String>,
+    log: VecDeque<String>,
     verbose: bool,
     status: StatusInfo,
     running: bool,
+    /// Something visible changed since the last draw.
+    redraw: bool,
     /// Per-device outgoing TLV queues (already framed, ready to write).
     tx_queues: [VecDeque<Vec<u8>>; NUM_DEVICES],
 }
@@ -65,18 +93,20 @@ impl App {
             master,
             irq,
             terminal: Terminal::new(),
-            log: Vec::new(),
+            log: VecDeque::with_capacity(LOG_CAPACITY),
             verbose: false,
             running: true,
+            redraw: true,
             tx_queues: Default::default(),
         }
     }
 
     fn log(&mut self, msg: String) {
         if self.log.len() >= LOG_CAPACITY {
-            self.log.remove(0);
+            self.log.pop_front();
         }
-        self.log.push(msg);
+        self.log.push_back(msg);
+        self.redraw = true;
     }
 
     fn log_verbose(&mut self, msg: String) {
@@ -88,7 +118,9 @@ impl App {
     /// Poll for and handle crossterm keyboard events.
     fn handle_input(&mut self) -> Result<()> {
         while event::poll(Duration::ZERO)? {
-            if let Event::Key(key) = event::read()? {
+            let ev = event::read()?;
+            self.redraw = true; // keys and resizes both need a repaint
+            if let Event::Key(key) = ev {
                 if key.kind != event::KeyEventKind::Press {
                     continue;
                 }
@@ -118,35 +150,59 @@ impl App {
         }
 
         self.log_verbose(format!("drain_spi: IRQ asserted"));
+        self.redraw = true;
+        let mut payload = Vec::with_capacity(MAX_PAYLOAD);
+        // Full payloads are dispatched during the next round's READY wait,
+        // overlapping our parsing with the Pico preparing its response.
+        let mut prev = Vec::with_capacity(MAX_PAYLOAD);
         let mut round = 0u32;
         loop {
             round += 1;
-            let result = self.master.request_and_read(Duration::from_millis(100))?;
-            match result {
-                Some((payload, _buf)) => {
-                    self.status.buf = self.master.buf;
-                    self.log_verbose(format!(
-                        "drain_spi[{round}]: READ {} payload bytes",
-                        payload.len()
-                    ));
-                    if !payload.is_empty() {
-                        for (device, data) in parse_tlv_payload(&payload) {
-                            self.dispatch_rx(device, &data);
-                        }
-                    }
-                    if payload.len() < MAX_PAYLOAD {
-                        break;
-                    }
-                }
-                None => {
-                    self.log(format!("drain_spi[{round}]: READY timeout"));
-                    break;
-                }
+            // Piggyback pending TX on every REQUEST, so keystrokes and echo
+            // replies are not held back until a long drain finishes.
+            let frame = self.build_tx_frame();
+            if !frame.is_empty() {
+                self.log_verbose(format!("SPI TX {} bytes", frame.len()));
+            }
+            self.master.request(&frame)?;
+            self.dispatch_payload(&prev);
+            prev.clear();
+
+            if !self.master.read(Duration::from_millis(100), &mut payload)? {
+                self.log(format!("drain_spi[{round}]: READY timeout"));
+                break;
+            }
+            self.status.buf = self.master.buf;
+            self.log_verbose(format!(
+                "drain_spi[{round}]: READ {} payload bytes",
+                payload.len()
+            ));
+            if payload.len() < MAX_PAYLOAD {
+                self.dispatch_payload(&payload);
+                break;
+            }
+            std::mem::swap(&mut prev, &mut payload);
+            // More to read: pick up keystrokes for the next round's WRITE.
+            self.handle_input()?;
+            if !self.running {
+                // No next round to overlap with; dispatch it now.
+                self.dispatch_payload(&prev);
+                prev.clear();
+                break;
             }
         }
+        // Every READ payload is dispatched exactly once.
+        debug_assert!(prev.is_empty());
         Ok(())
     }
 
+    /// Dispatch every TLV in a READ payload.
+    fn dispatch_payload(&mut self, payload: &[u8]) {
+        for (device, data) in parse_tlv_payload(payload) {
+            self.dispatch_rx(device, data);
+        }
+    }
+
     /// Dispatch a received TLV message by device ID.
     fn dispatch_rx(&mut self, device: u8, data: &[u8]) {
         match device {
@@ -180,19 +236,15 @@ impl App {
             }
             7 => {
                 // Echo: log summary and send back
-                let n = data.len();
-                let preview = if n <= 10 {
-                    data.iter()
-                        .map(|b| format!("{b:02x}"))
-                        .collect::<Vec<_>>()
-                        .join(" ")
-                } else {
-                    let head: Vec<String> = data[..5].iter().map(|b| format!("{b:02x}")).collect();
-                    let tail: Vec<String> =
-                        data[n - 5..].iter().map(|b| format!("{b:02x}")).collect();
-                    format!("{} .. {}", head.join(" "), tail.join(" "))
-                };
-                self.log_verbose(format!("Echo: {n} bytes [{preview}]"));
+                if self.verbose {
+                    let n = data.len();
+                    let preview = if n <= 10 {
+                        hex_bytes(data)
+                    } else {
+                        format!("{} .. {}", hex_bytes(&data[..5]), hex_bytes(&data[n - 5..]))
+                    };
+                    self.log(format!("Echo: {n} bytes [{preview}]"));
+                }
                 self.enqueue_tlv(7, data);
             }
             _ => {
@@ -224,9 +276,38 @@ impl App {
         }
     }
 
-    /// Drain per-device TX queues into a single SPI frame (up to MAX_PAYLOAD).
-    /// Skips devices whose Pico buffer is full, avoiding head-of-line blocking.
+    /// Drain per-device TX queues into up to TX_FRAMES_PER_PASS SPI frames
+    /// (as flow control allows) and WRITE them in one batch. The cap keeps
+    /// each pass within TX_RING_BUDGET of the Pico's RX ring; run_loop wakes
+    /// every TX_PACING while TX is left.
     fn drain_tx_queue(&mut self) -> Result<()> {
+        let mut frames = Vec::new();
+        while frames.len() < TX_FRAMES_PER_PASS {
+            let frame = self.build_tx_frame();
+            if frame.is_empty() {
+                break;
+            }
+            frames.push(frame);
+        }
+
+        if !frames.is_empty() {
+            let total: usize = frames.iter().map(Vec::len).sum();
+            self.log_verbose(format!("SPI TX {total} bytes in {} frames", frames.len()));
+            self.master.write_batch(&frames)?;
+            self.status.buf = self.master.buf;
+            self.redraw = true;
+        }
+        Ok(())
+    }
+
+    fn tx_pending(&self) -> bool {
+        self.tx_queues.iter().any(|q| !q.is_empty())
+    }
+
+    /// Pop queued TLVs into a single SPI frame (up to MAX_PAYLOAD), charging
+    /// each device's buffer estimate. Skips devices whose Pico buffer is full,
+    /// avoiding head-of-line blocking.
+    fn build_tx_frame(&mut self) -> Vec<u8> {
         let mut frame = Vec::new();
 
         // Keep looping until no device can contribute a frame.
@@ -260,13 +341,7 @@ impl App {
             }
         }
 
-        if !frame.is_empty() {
-            self.log_verbose(format!("SPI TX {} bytes", frame.len()));
-            self.master.write(&frame)?;
-            self.status.buf = self.master.buf;
-        }
-
-        Ok(())
+        frame
     }
 
     /// Read a named file and enqueue it over device 3 with a 2-byte BE length prefix.
@@ -275,8 +350,7 @@ impl App {
             Ok(file_data) => {
                 let total_len = file_data.len() as u16;
                 let mut prefixed = Vec::with_capacity(2 + file_data.len());
-                prefixed.push((total_len >> 8) as u8);
-                prefixed.push((total_len & 0xFF) as u8);
+                prefixed.extend_from_slice(&total_len.to_be_bytes());
                 prefixed.extend_from_slice(&file_data);
                 self.log(format!(
                     "Netboot: sending {} bytes from {name}",
@@ -343,27 +417,41 @@ fn key_to_bytes(key: &KeyEvent) -> Option<Vec<u8>> {
     }
 }
 
+/// Parse command-line options (without the program name); currently just
+/// `--spi-hz <N>`.
+fn spi_speed_from_args(args: impl IntoIterator<Item = String>) -> Result<u32> {
+    let mut speed_hz = DEFAULT_SPI_SPEED_HZ;
+    let mut args = args.into_iter();
+    while let Some(arg) = args.next() {
+        match arg.as_str() {
+            "--spi-hz" => {
+                let value = args.next().context("--spi-hz needs a value")?;
+                speed_hz = value
+                    .parse()
+                    .with_context(|| format!("Invalid --spi-hz value: {value}"))?;
+                if !(1..=MAX_SPI_SPEED_HZ).contains(&speed_hz) {
+                    bail!(
+                        "--spi-hz must be between 1 and {MAX_SPI_SPEED_HZ} (Pico SPI slave limit)"
+                    );
+                }
+            }
+            _ => bail!("Unknown argument: {arg}"),
+        }
+    }
+    Ok(speed_hz)
+}
+
 fn main() -> Result<()> {
+    let speed_hz = spi_speed_from_args(std::env::args().skip(1))?;
+
     // Pre-TUI initialization: connect to SPI
-    println!("Connecting to Pico...");
+    println!("Connecting to Pico at {speed_hz} Hz...");
 
     let irq = IrqWatcher::new()?;
-    let mut master = SpiMaster::new()?;
-
-    // Probably not needed, Pico will realistically be up before Zero.
-
-    // print!("Waiting for IRQ... ");
-    // if !irq.is_asserted()? {
-    //     if !irq.wait_edge(Duration::from_secs(10))? {
-    //         println!("TIMEOUT");
-    //         return Ok(());
-    //     }
-    //     irq.consume_edge()?;
-    // }
-    // println!("OK");
+    let mut master = SpiMaster::new(speed_hz)?;
 
     // Initial sync
-    if master.request_and_read(Duration::from_secs(2))?.is_none() {
+    if !master.request_and_read(Duration::from_secs(2), &mut Vec::new())? {
         println!("TIMEOUT on initial sync");
         return Ok(());
     }
@@ -393,16 +481,26 @@ fn run_loop(
     app: &mut App,
 ) -> Result<()> {
     while app.running {
-        // Render
-        tui.draw(|frame| {
-            ui::draw(frame, &app.terminal, &app.status, &app.log);
-        })?;
-
-        // Poll crossterm events with a short timeout
-        if event::poll(Duration::from_millis(10))? {
-            app.handle_input()?;
+        // Render, only if something changed
+        if app.redraw {
+            tui.draw(|frame| {
+                ui::draw(frame, &app.terminal, &app.status, &app.log);
+            })?;
+            app.redraw = false;
         }
 
+        // Sleep until a keypress or IRQ instead of polling at a fixed rate.
+        // The timeout bounds how late we notice events crossterm reports
+        // without stdin activity, such as resizes. Queued TX is paced out
+        // in bounded batches, so wake sooner while any is left.
+        let timeout = if app.tx_pending() {
+            TX_PACING
+        } else {
+            IDLE_TIMEOUT
+        };
+        app.irq.wait_irq_or_stdin(timeout)?;
+        app.handle_input()?;
+
         // Check SPI
         app.drain_spi()?;
 
@@ -411,3 +509,69 @@ fn run_loop(
     }
     Ok(())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::{hex_bytes, parse_tlv_payload, spi_speed_from_args};
+    use crate::spi_master::{DEFAULT_SPI_SPEED_HZ, MAX_SPI_SPEED_HZ, batch_ends};
+
+    fn args(list: &[&str]) -> Vec<String> {
+        list.iter().map(|s| s.to_string()).collect()
+    }
+
+    #[test]
+    fn hex_bytes_formats_space_separated_pairs() {
+        assert_eq!(hex_bytes(&[0x00, 0x7f, 0xab]), "00 7f ab");
+        assert_eq!(hex_bytes(&[]), "");
+    }
+
+    #[test]
+    fn parse_tlv_payload_stops_at_truncated_packet() {
+        let payload = [2, 2, b'h', b'i', 7, 0, 3, 5, b'x'];
+        let msgs = parse_tlv_payload(&payload);
+
+        assert_eq!(msgs, vec![(2, &b"hi"[..]), (7, &b""[..])]);
+    }
+
+    #[test]
+    fn batch_ends_packs_by_dma_aligned_size() {
+        // 1545-byte frames pad to 1664: two fit in 4096, a third does not.
+        assert_eq!(batch_ends(&[1545, 1545, 1545], 4096), vec![2, 3]);
+        // Small frames still pad a full alignment unit each.
+        assert_eq!(batch_ends(&[3; 33], 4096), vec![32, 33]);
+    }
+
+    #[test]
+    fn batch_ends_fills_bufsiz_exactly() {
+        assert_eq!(batch_ends(&[2048, 2048, 1], 4096), vec![2, 3]);
+        assert_eq!(batch_ends(&[2048, 2049], 4096), vec![1, 2]);
+    }
+
+    #[test]
+    fn batch_ends_sends_oversize_frame_alone() {
+        assert_eq!(batch_ends(&[5000, 10, 5000], 4096), vec![1, 2, 3]);
+        assert!(batch_ends(&[], 4096).is_empty());
+    }
+
+    #[test]
+    fn spi_speed_defaults_and_accepts_range() {
+        assert_eq!(
+            spi_speed_from_args(args(&[])).unwrap(),
+            DEFAULT_SPI_SPEED_HZ
+        );
+        assert_eq!(spi_speed_from_args(args(&["--spi-hz", "1"])).unwrap(), 1);
+        assert_eq!(
+            spi_speed_from_args(args(&["--spi-hz", "12500000"])).unwrap(),
+            MAX_SPI_SPEED_HZ
+        );
+    }
+
+    #[test]
+    fn spi_speed_rejects_bad_values() {
+        assert!(spi_speed_from_args(args(&["--spi-hz", "0"])).is_err());
+        assert!(spi_speed_from_args(args(&["--spi-hz", "12500001"])).is_err());
+        assert!(spi_speed_from_args(args(&["--spi-hz", "fast"])).is_err());
+        assert!(spi_speed_from_args(args(&["--spi-hz"])).is_err());
+        assert!(spi_speed_from_args(args(&["--verbose"])).is_err());
+    }
+}
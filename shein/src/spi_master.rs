@@ -1,33 +1,99 @@
 pub const MAX_PAYLOAD: usize = 1542; // 257*6: room for 6 max-size TLV packets
 pub const NUM_DEVICES: usize = 8;
+pub const READ_SIZE: usize = MAX_PAYLOAD + 10; // 8 buf + 2 len + payload
+pub const DEFAULT_SPI_SPEED_HZ: u32 = 8_000_000;
+pub const MAX_SPI_SPEED_HZ: u32 = 12_500_000; // Pico PL022 slave: clk_peri (150 MHz) / 12
+
+const DMA_MINALIGN: usize = 128; // upper bound of ARCH_DMA_MINALIGN on Pi kernels
+
+/// Bytes a segment of `len` counts against bufsiz: spidev_message()
+/// rounds every segment up to ARCH_DMA_MINALIGN.
+const fn dma_aligned(len: usize) -> usize {
+    len.next_multiple_of(DMA_MINALIGN)
+}
+
+/// Split WRITE frames of `lens` bytes, one segment each, into spidev
+/// messages whose DMA-aligned size fits `bufsiz`. Returns the exclusive end
+/// index of each message. Every message carries at least one frame, even one
+/// larger than `bufsiz`, so the caller always makes progress.
+#[cfg_attr(not(target_os = "linux"), allow(dead_code))]
+pub fn batch_ends(lens: &[usize], bufsiz: usize) -> Vec<usize> {
+    let mut ends = Vec::new();
+    let mut bytes = 0;
+    for (i, &len) in lens.iter().enumerate() {
+        let segment = dma_aligned(len);
+        if bytes > 0 && bytes + segment > bufsiz {
+            ends.push(i);
+            bytes = 0;
+        }
+        bytes += segment;
+    }
+    if !lens.is_empty() {
+        ends.push(lens.len());
+    }
+    ends
+}
 
 // ── Linux (real hardware) ───────────────────────────────────────────────────
 
 #[cfg(target_os = "linux")]
 mod hw {
-    use std::io::Write;
+    use std::io::{self, Write};
+    use std::os::fd::AsRawFd;
     use std::time::{Duration, Instant};
 
-    use anyhow::{Context, Result};
+    use anyhow::{Context, Result, ensure};
     use gpiocdev::Request;
     use gpiocdev::line::{Bias, EdgeDetection, Value};
     use spidev::{SpiModeFlags, Spidev, SpidevOptions, SpidevTransfer};
 
+    use super::{READ_SIZE, batch_ends, dma_aligned};
+
     const SPI_CMD_WRITE: u8 = 0x01;
     const SPI_CMD_REQUEST: u8 = 0x02;
     const SPI_CMD_READ: u8 = 0x03;
 
-    const READ_SIZE: usize = super::MAX_PAYLOAD + 10; // 8 buf + 2 len + payload
+    /// TX side of every READ: the command byte, then zero padding.
+    static READ_TX: [u8; READ_SIZE] = {
+        let mut tx = [0u8; READ_SIZE];
+        tx[0] = SPI_CMD_READ;
+        tx
+    };
 
     const GPIO_CHIP: &str = "/dev/gpiochip0";
     const PIN_IRQ: u32 = 25;
     const PIN_READY: u32 = 24;
 
+    const EDGE_EVENT_BATCH: usize = 16; // IRQ/READY edge events drained per read()
+    const READY_SPIN: Duration = Duration::from_micros(50); // busy-poll before blocking on an edge
+
     const SPI_DEVICE: &str = "/dev/spidev0.0";
-    const SPI_SPEED_HZ: u32 = 8_000_000;
+    const SPIDEV_BUFSIZ_PARAM: &str = "/sys/module/spidev/parameters/bufsiz";
+    const SPIDEV_DEFAULT_BUFSIZ: usize = 4096;
+
+    /// Smallest usable bufsiz: the largest message is a full WRITE frame
+    /// fused with REQUEST (1792 bytes), which also covers a READ (1664).
+    const MIN_BUFSIZ: usize = dma_aligned(3 + super::MAX_PAYLOAD) + dma_aligned(1);
+
+    /// spidev's per-message buffer size (module parameter), which bounds
+    /// the bytes in each ioctl.
+    fn spidev_bufsiz() -> usize {
+        std::fs::read_to_string(SPIDEV_BUFSIZ_PARAM)
+            .ok()
+            .and_then(|s| s.trim().parse().ok())
+            .unwrap_or(SPIDEV_DEFAULT_BUFSIZ)
+    }
+
+    /// WRITE frame header: command + payload length (big-endian).
+    fn write_header(len: usize) -> [u8; 3] {
+        let [hi, lo] = (len as u16).to_be_bytes();
+        [SPI_CMD_WRITE, hi, lo]
+    }
 
     pub struct IrqWatcher {
         req: Request,
+        /// Raw kernel edge events, drained from IRQ in bulk.
+        events: Vec<u64>,
     }
 
     impl IrqWatcher {
@@ -41,7 +107,8 @@ mod hw {
                 .with_consumer("shein-irq")
                 .request()
                 .context("Failed to request IRQ GPIO")?;
-            Ok(Self { req })
+            let events = vec![0u64; req.edge_event_size() * EDGE_EVENT_BATCH];
+            Ok(Self { req, events })
         }
 
         pub fn is_asserted(&self) -> Result<bool> {
@@ -49,28 +116,70 @@ mod hw {
             Ok(val == Value::Inactive)
         }
 
-        pub fn wait_edge(&self, timeout: Duration) -> Result<bool> {
-            Ok(self.req.wait_edge_event(timeout)?)
-        }
+        /// Sleep until IRQ is asserted, stdin is readable, or `timeout` elapses.
+        /// Returns at once if IRQ is already asserted.
+        pub fn wait_irq_or_stdin(&mut self, timeout: Duration) -> Result<()> {
+            // Discard stale edges before checking the level, so an edge that
+            // arrives after the check still wakes the poll below.
+            while self.req.has_edge_event()? {
+                self.req.read_edge_events_into_slice(&mut self.events)?;
+            }
+            if self.is_asserted()? {
+                return Ok(());
+            }
 
-        pub fn consume_edge(&self) -> Result<()> {
-            self.req.read_edge_event()?;
+            let mut fds = [
+                libc::pollfd {
+                    fd: self.req.as_raw_fd(),
+                    events: libc::POLLIN,
+                    revents: 0,
+                },
+                libc::pollfd {
+                    fd: io::stdin().as_raw_fd(),
+                    events: libc::POLLIN,
+                    revents: 0,
+                },
+            ];
+            let timeout_ms = timeout.as_millis().min(i32::MAX as u128) as i32;
+            // SAFETY: `fds` is a valid array of pollfd for the duration of the call.
+            let ret =
+                unsafe { libc::poll(fds.as_mut_ptr(), fds.len() as libc::nfds_t, timeout_ms) };
+            if ret < 0 {
+                let err = io::Error::last_os_error();
+                if err.kind() != io::ErrorKind::Interrupted {
+                    return Err(err).context("poll on IRQ/stdin failed");
+                }
+            }
             Ok(())
         }
     }
 
     pub struct SpiMaster {
         spi: Spidev,
+        /// Max bytes per spidev message.
+        bufsiz: usize,
         ready: Request,
+        /// Raw kernel edge events, drained from READY in bulk.
+        ready_events: Vec<u64>,
+        /// WRITE frames (header + payload) staged for the next ioctl.
+        write_buf: Vec<u8>,
+        /// READ response, reused across transactions.
+        rx_buf: Vec<u8>,
         pub buf: [u16; super::NUM_DEVICES],
     }
 
     impl SpiMaster {
-        pub fn new() -> Result<Self> {
+        pub fn new(speed_hz: u32) -> Result<Self> {
+            let bufsiz = spidev_bufsiz();
+            ensure!(
+                bufsiz >= MIN_BUFSIZ,
+                "spidev bufsiz ({bufsiz}) is smaller than a DMA-aligned WRITE+REQUEST ({MIN_BUFSIZ} bytes)"
+            );
+
             let mut spi = Spidev::open(SPI_DEVICE).context("Failed to open SPI device")?;
             let options = SpidevOptions::new()
                 .bits_per_word(8)
-                .max_speed_hz(SPI_SPEED_HZ)
+                .max_speed_hz(speed_hz)
                 .mode(SpiModeFlags::SPI_MODE_3)
                 .build();
             spi.configure(&options).context("Failed to configure SPI")?;
@@ -80,92 +189,195 @@ mod hw {
                 .with_line(PIN_READY)
                 .as_input()
                 .with_bias(Bias::PullUp)
+                .with_edge_detection(EdgeDetection::BothEdges)
                 .with_consumer("shein-ready")
                 .request()
                 .context("Failed to request READY GPIO")?;
 
+            // Any packed batch fits: its aligned size is at most bufsiz.
+            let write_buf = vec![0u8; bufsiz];
+
+            let ready_events = vec![0u64; ready.edge_event_size() * EDGE_EVENT_BATCH];
+
             Ok(Self {
                 spi,
+                bufsiz,
                 ready,
+                ready_events,
+                write_buf,
+                rx_buf: vec![0u8; READ_SIZE],
                 buf: [0u16; super::NUM_DEVICES],
             })
         }
 
-        fn wait_ready(&self, timeout: Duration) -> Result<bool> {
-            let deadline = Instant::now() + timeout;
-            while Instant::now() < deadline {
-                if self.ready.value(PIN_READY)? == Value::Inactive {
+        fn wait_ready(&mut self, timeout: Duration) -> Result<bool> {
+            self.wait_ready_value(Value::Inactive, timeout)
+        }
+
+        fn wait_ready_deasserted(&mut self, timeout: Duration) -> Result<bool> {
+            self.wait_ready_value(Value::Active, timeout)
+        }
+
+        /// Wait for READY to reach `want`. Spins briefly first, since the Pico
+        /// usually answers within tens of microseconds, then sleeps on edge
+        /// events. The level is always re-read, so stale edges only cost a wakeup.
+        fn wait_ready_value(&mut self, want: Value, timeout: Duration) -> Result<bool> {
+            let start = Instant::now();
+            let spin_until = start + READY_SPIN.min(timeout);
+            while Instant::now() < spin_until {
+                if self.ready.value(PIN_READY)? == want {
                     return Ok(true);
                 }
-                std::thread::sleep(Duration::from_micros(100));
+                std::hint::spin_loop();
             }
-            Ok(false)
-        }
 
-        fn wait_ready_deasserted(&self, timeout: Duration) -> Result<bool> {
-            let deadline = Instant::now() + timeout;
-            while Instant::now() < deadline {
-                if self.ready.value(PIN_READY)? == Value::Active {
+            let deadline = start + timeout;
+            loop {
+                if self.ready.value(PIN_READY)? == want {
                     return Ok(true);
                 }
-                std::thread::sleep(Duration::from_micros(100));
+                let now = Instant::now();
+                if now >= deadline {
+                    return Ok(false);
+                }
+                if self.ready.wait_edge_event(deadline - now)? {
+                    self.drain_ready_edges()?;
+                }
             }
-            Ok(false)
         }
 
-        pub fn write(&mut self, payload: &[u8]) -> Result<bool> {
-            if payload.len() > super::MAX_PAYLOAD {
-                return Ok(false);
+        /// Discard queued READY edges, up to EDGE_EVENT_BATCH per read().
+        fn drain_ready_edges(&mut self) -> Result<()> {
+            while self.ready.has_edge_event()? {
+                self.ready
+                    .read_edge_events_into_slice(&mut self.ready_events)?;
+            }
+            Ok(())
+        }
+
+        /// Write a WRITE frame for `payload` into `write_buf` at `at`; returns
+        /// the offset just past it.
+        fn fill_write_buf(&mut self, at: usize, payload: &[u8]) -> usize {
+            let len = payload.len();
+            self.write_buf[at..at + 3].copy_from_slice(&write_header(len));
+            self.write_buf[at + 3..at + 3 + len].copy_from_slice(payload);
+            at + 3 + len
+        }
+
+        /// WRITE each payload as its own frame, packing as many frames as fit
+        /// in spidev's bufsiz into each ioctl (CS released between). Frames
+        /// are staged back to back in `write_buf`, one TX-only segment each.
+        pub fn write_batch(&mut self, payloads: &[Vec<u8>]) -> Result<()> {
+            for payload in payloads {
+                ensure!(
+                    payload.len() <= super::MAX_PAYLOAD,
+                    "WRITE payload too large ({} bytes)",
+                    payload.len()
+                );
             }
 
-            let len = payload.len() as u16;
-            let mut tx = Vec::with_capacity(3 + payload.len());
-            tx.push(SPI_CMD_WRITE);
-            tx.push((len >> 8) as u8);
-            tx.push((len & 0xFF) as u8);
-            tx.extend_from_slice(payload);
+            // new() guarantees bufsiz holds one aligned max-size frame.
+            let lens: Vec<usize> = payloads.iter().map(|p| 3 + p.len()).collect();
+            let mut offsets = Vec::new();
+            let mut start = 0;
+            for end in batch_ends(&lens, self.bufsiz) {
+                offsets.clear();
+                let mut at = 0;
+                for payload in &payloads[start..end] {
+                    at = self.fill_write_buf(at, payload);
+                    offsets.push(at);
+                }
 
-            self.spi
-                .write_all(&tx)
-                .context("SPI WRITE transfer failed")?;
+                let mut transfers = Vec::with_capacity(offsets.len());
+                let mut from = 0;
+                for &to in &offsets {
+                    let mut transfer = SpidevTransfer::write(&self.write_buf[from..to]);
+                    transfer.cs_change = 1;
+                    transfers.push(transfer);
+                    from = to;
+                }
+                // CS is released at the end of the message anyway.
+                if let Some(last) = transfers.last_mut() {
+                    last.cs_change = 0;
+                }
+                self.spi
+                    .transfer_multiple(&mut transfers)
+                    .context("SPI WRITE transfer failed")?;
 
-            Ok(true)
+                start = end;
+            }
+
+            Ok(())
         }
 
         pub fn request_and_read(
             &mut self,
             timeout: Duration,
-        ) -> Result<Option<(Vec<u8>, [u16; super::NUM_DEVICES])>> {
+            payload: &mut Vec<u8>,
+        ) -> Result<bool> {
+            self.request(&[])?;
+            self.read(timeout, payload)
+        }
+
+        /// Send REQUEST, preceded in the same ioctl by a WRITE of `payload` if
+        /// it is non-empty (CS is released between the two). Must be followed
+        /// by `read` before any other transaction.
+        pub fn request(&mut self, payload: &[u8]) -> Result<()> {
+            let request = [SPI_CMD_REQUEST];
+            if payload.is_empty() {
+                self.spi
+                    .write_all(&request)
+                    .context("SPI REQUEST transfer failed")?;
+                return Ok(());
+            }
+
+            ensure!(
+                payload.len() <= super::MAX_PAYLOAD,
+                "WRITE payload too large ({} bytes)",
+                payload.len()
+            );
+
+            let n = self.fill_write_buf(0, payload);
+            let mut transfers = [
+                SpidevTransfer::write(&self.write_buf[..n]),
+                SpidevTransfer::write(&request),
+            ];
+            transfers[0].cs_change = 1;
             self.spi
-                .write_all(&[SPI_CMD_REQUEST])
-                .context("SPI REQUEST transfer failed")?;
+                .transfer_multiple(&mut transfers)
+                .context("SPI WRITE+REQUEST transfer failed")?;
+
+            Ok(())
+        }
 
+        /// Wait for READY after a REQUEST, then clock out the READ response.
+        /// The payload replaces the contents of `payload`, reusing its
+        /// allocation; `buf` is refreshed. Returns false on READY timeout.
+        pub fn read(&mut self, timeout: Duration, payload: &mut Vec<u8>) -> Result<bool> {
             if !self.wait_ready(timeout)? {
-                return Ok(None);
+                return Ok(false);
             }
 
-            let mut tx_buf = vec![0u8; READ_SIZE];
-            tx_buf[0] = SPI_CMD_READ;
-            let mut rx_buf = vec![0u8; READ_SIZE];
-
-            let mut transfer = SpidevTransfer::read_write(&tx_buf, &mut rx_buf);
+            let mut transfer = SpidevTransfer::read_write(&READ_TX, &mut self.rx_buf);
             self.spi
                 .transfer(&mut transfer)
                 .context("SPI READ transfer failed")?;
 
             let _ = self.wait_ready_deasserted(Duration::from_millis(100));
 
+            let rx_buf = &self.rx_buf;
             // Bytes 0..8: per-device buffer estimates (in 16-byte units), convert to bytes
             for i in 0..super::NUM_DEVICES {
                 self.buf[i] = (rx_buf[i] as u16) * 16;
             }
 
             // Bytes 8..10: payload length (big-endian)
-            let payload_len = ((rx_buf[8] as usize) << 8) | (rx_buf[9] as usize);
+            let payload_len = u16::from_be_bytes([rx_buf[8], rx_buf[9]]) as usize;
             let payload_len = payload_len.min(super::MAX_PAYLOAD);
-            let payload = rx_buf[10..10 + payload_len].to_vec();
+            payload.clear();
+            payload.extend_from_slice(&rx_buf[10..10 + payload_len]);
 
-            Ok(Some((payload, self.buf)))
+            Ok(true)
         }
     }
 }
@@ -174,7 +386,7 @@ mod hw {
 
 #[cfg(not(target_os = "linux"))]
 mod hw {
-    use anyhow::Result;
+    use anyhow::{Result, ensure};
     use std::time::Duration;
 
     pub struct IrqWatcher;
@@ -188,12 +400,8 @@ mod hw {
             Ok(false)
         }
 
-        pub fn wait_edge(&self, timeout: Duration) -> Result<bool> {
-            std::thread::sleep(timeout);
-            Ok(false)
-        }
-
-        pub fn consume_edge(&self) -> Result<()> {
+        pub fn wait_irq_or_stdin(&mut self, timeout: Duration) -> Result<()> {
+            std::thread::sleep(timeout.min(Duration::from_millis(10)));
             Ok(())
         }
     }
@@ -203,25 +411,45 @@ mod hw {
     }
 
     impl SpiMaster {
-        pub fn new() -> Result<Self> {
+        pub fn new(_speed_hz: u32) -> Result<Self> {
             Ok(Self {
                 buf: [255 * 16; super::NUM_DEVICES],
             })
         }
 
-        pub fn write(&mut self, payload: &[u8]) -> Result<bool> {
-            if payload.len() > super::MAX_PAYLOAD {
-                return Ok(false);
+        pub fn write_batch(&mut self, payloads: &[Vec<u8>]) -> Result<()> {
+            for payload in payloads {
+                ensure!(
+                    payload.len() <= super::MAX_PAYLOAD,
+                    "WRITE payload too large ({} bytes)",
+                    payload.len()
+                );
             }
-            Ok(true)
+            Ok(())
         }
 
         pub fn request_and_read(
             &mut self,
-            _timeout: Duration,
-        ) -> Result<Option<(Vec<u8>, [u16; super::NUM_DEVICES])>> {
+            timeout: Duration,
+            payload: &mut Vec<u8>,
+        ) -> Result<bool> {
+            self.request(&[])?;
+            self.read(timeout, payload)
+        }
+
+        pub fn request(&mut self, payload: &[u8]) -> Result<()> {
+            ensure!(
+                payload.len() <= super::MAX_PAYLOAD,
+                "WRITE payload too large ({} bytes)",
+                payload.len()
+            );
+            Ok(())
+        }
+
+        pub fn read(&mut self, _timeout: Duration, payload: &mut Vec<u8>) -> Result<bool> {
             self.buf = [255 * 16; super::NUM_DEVICES];
-            Ok(Some((Vec::new(), self.buf)))
+            payload.clear();
+            Ok(true)
         }
     }
 }
@@ -3,6 +3,7 @@ use vte::{Params, Parser, Perform};
 
 pub const COLS: usize = 40;
 pub const ROWS: usize = 25;
+const MAX_PARAMS: usize = 32; // vte's per-sequence parameter limit
 
 #[derive(Clone, Copy)]
 pub struct Cell {
@@ -42,25 +43,24 @@ impl Terminal {
 
     /// Feed raw bytes from device 2 into the terminal.
     pub fn feed(&mut self, bytes: &[u8]) {
+        // VTE parser calls back into our Perform impl via a helper closure.
+        // We need to use a temporary because Parser::advance takes &mut self
+        // and calls Perform methods on a separate receiver. Take it out once
+        // for the whole chunk rather than per byte.
+        let mut parser = std::mem::replace(&mut self.parser, Parser::new());
         for &b in bytes {
             if b == 0x7f {
                 self.clear_line_ending_state();
                 self.backspace();
                 continue;
             }
-            // VTE parser calls back into our Perform impl via a helper closure.
-            // We need to use a temporary because Parser::advance takes &mut self
-            // and calls Perform methods on a separate receiver.
-            let mut parser = std::mem::replace(&mut self.parser, Parser::new());
             parser.advance(self, b);
-            self.parser = parser;
         }
+        self.parser = parser;
     }
 
     fn scroll_up(&mut self) {
-        for row in 1..ROWS {
-            self.cells[row - 1] = self.cells[row];
-        }
+        self.cells.copy_within(1.., 0);
         self.cells[ROWS - 1] = [Cell::default(); COLS];
     }
 
@@ -108,9 +108,8 @@ impl Terminal {
         }
     }
 
-    fn apply_sgr(&mut self, params: &Params) {
-        // Collect into a flat Vec so we can index-advance for extended colors
-        let p: Vec<u16> = params.iter().map(|s| s[0]).collect();
+    fn apply_sgr(&mut self, p: &[u16]) {
+        // Flat slice so we can index-advance for extended colors
         let mut i = 0;
         while i < p.len() {
             match p[i] {
@@ -197,21 +196,13 @@ impl Terminal {
         match mode {
             0 => {
                 // Erase from cursor to end
-                for col in self.cursor_col..COLS {
-                    self.cells[self.cursor_row][col] = Cell::default();
-                }
-                for row in (self.cursor_row + 1)..ROWS {
-                    self.cells[row] = [Cell::default(); COLS];
-                }
+                self.cells[self.cursor_row][self.cursor_col..].fill(Cell::default());
+                self.cells[self.cursor_row + 1..].fill([Cell::default(); COLS]);
             }
             1 => {
                 // Erase from start to cursor
-                for row in 0..self.cursor_row {
-                    self.cells[row] = [Cell::default(); COLS];
-                }
-                for col in 0..=self.cursor_col {
-                    self.cells[self.cursor_row][col] = Cell::default();
-                }
+                self.cells[..self.cursor_row].fill([Cell::default(); COLS]);
+                self.cells[self.cursor_row][..=self.cursor_col].fill(Cell::default());
             }
             2 | 3 => {
                 // Erase entire display
@@ -225,15 +216,11 @@ impl Terminal {
         match mode {
             0 => {
                 // Erase from cursor to end of line
-                for col in self.cursor_col..COLS {
-                    self.cells[self.cursor_row][col] = Cell::default();
-                }
+                self.cells[self.cursor_row][self.cursor_col..].fill(Cell::default());
             }
             1 => {
                 // Erase from start of line to cursor
-                for col in 0..=self.cursor_col {
-                    self.cells[self.cursor_row][col] = Cell::default();
-                }
+                self.cells[self.cursor_row][..=self.cursor_col].fill(Cell::default());
             }
             2 => {
                 // Erase entire line
@@ -244,6 +231,18 @@ impl Terminal {
     }
 }
 
+/// First value of each CSI parameter, collected on the stack (vte caps
+/// sequences at MAX_PARAMS). Returns the values and how many were set.
+fn param_values(params: &Params) -> ([u16; MAX_PARAMS], usize) {
+    let mut vals = [0u16; MAX_PARAMS];
+    let mut len = 0;
+    for (slot, param) in vals.iter_mut().zip(params.iter()) {
+        *slot = param[0];
+        len += 1;
+    }
+    (vals, len)
+}
+
 /// Parse extended color from remaining SGR params after a 38 or 48.
 /// Returns (Color, number_of_params_consumed) or None.
 fn parse_extended_color(rest: &[u16]) -> Option<(Color, usize)> {
@@ -297,12 +296,13 @@ impl Perform for Terminal {
         action: char,
     ) {
         self.clear_line_ending_state();
-        let p: Vec<u16> = params.iter().map(|p| p[0]).collect();
+        let (vals, len) = param_values(params);
+        let p = &vals[..len];
         let p1 = || p.first().copied().unwrap_or(1).max(1) as usize;
         let p0 = || p.first().copied().unwrap_or(0);
 
         match action {
-            'm' => self.apply_sgr(params),
+            'm' => self.apply_sgr(p),
             'A' => self.cursor_row = self.cursor_row.saturating_sub(p1()),
             'B' => self.cursor_row = (self.cursor_row + p1()).min(ROWS - 1),
             'C' => self.cursor_col = (self.cursor_col + p1()).min(COLS - 1),
@@ -333,7 +333,8 @@ impl Perform for Terminal {
 
 #[cfg(test)]
 mod tests {
-    use super::Terminal;
+    use super::{ROWS, Terminal};
+    use ratatui::style::{Color, Modifier, Style};
 
     #[test]
     fn backspace_clears_previous_character() {
@@ -388,4 +389,52 @@ mod tests {
         assert_eq!(terminal.cursor_row, 1);
         assert_eq!(terminal.cursor_col, 1);
     }
+
+    #[test]
+    fn scrolls_up_when_writing_past_last_row() {
+        let mut terminal = Terminal::new();
+        for row in 0..ROWS {
+            terminal.feed(format!("{}\n", (b'a' + row as u8) as char).as_bytes());
+        }
+
+        assert_eq!(terminal.cells[0][0].ch, 'b');
+        assert_eq!(
+            terminal.cells[ROWS - 2][0].ch,
+            (b'a' + ROWS as u8 - 1) as char
+        );
+        assert_eq!(terminal.cells[ROWS - 1][0].ch, ' ');
+        assert_eq!(terminal.cursor_row, ROWS - 1);
+    }
+
+    #[test]
+    fn cursor_position_uses_one_based_params() {
+        let mut terminal = Terminal::new();
+        terminal.feed(b"\x1b[3;5HX");
+
+        assert_eq!(terminal.cells[2][4].ch, 'X');
+        assert_eq!(terminal.cursor_row, 2);
+        assert_eq!(terminal.cursor_col, 5);
+    }
+
+    #[test]
+    fn sgr_applies_multiple_and_extended_color_params() {
+        let mut terminal = Terminal::new();
+        terminal.feed(b"\x1b[1;38;5;196mX\x1b[48;2;1;2;3mY");
+
+        let x_style = Style::default()
+            .add_modifier(Modifier::BOLD)
+            .fg(Color::Indexed(196));
+        assert_eq!(terminal.cells[0][0].style, x_style);
+        assert_eq!(terminal.cells[0][1].style, x_style.bg(Color::Rgb(1, 2, 3)));
+    }
+
+    #[test]
+    fn erase_in_line_clears_to_end() {
+        let mut terminal = Terminal::new();
+        terminal.feed(b"ABCD\x1b[3G\x1b[K");
+
+        assert_eq!(terminal.cells[0][1].ch, 'B');
+        assert_eq!(terminal.cells[0][2].ch, ' ');
+        assert_eq!(terminal.cells[0][3].ch, ' ');
+    }
 }
@@ -1,3 +1,5 @@
+use std::collections::VecDeque;
+
 use ratatui::Frame;
 use ratatui::layout::{Constraint, Direction, Layout, Rect};
 use ratatui::style::{Color, Style};
@@ -17,7 +19,7 @@ pub struct StatusInfo {
     pub verbose: bool,
 }
 
-pub fn draw(frame: &mut Frame, terminal: &Terminal, status: &StatusInfo, log: &[String]) {
+pub fn draw(frame: &mut Frame, terminal: &Terminal, status: &StatusInfo, log: &VecDeque<String>) {
     let area = frame.area();
     if area.height < MIN_HEIGHT || area.width < MIN_WIDTH {
         let msg = format!(
@@ -115,7 +117,7 @@ fn draw_status(frame: &mut Frame, status: &StatusInfo, area: Rect) {
     frame.render_widget(paragraph, area);
 }
 
-fn draw_log(frame: &mut Frame, log: &[String], area: Rect) {
+fn draw_log(frame: &mut Frame, log: &VecDeque<String>, area: Rect) {
     let inner_height = area.height.saturating_sub(2) as usize;
     let inner_width = area.width.saturating_sub(2) as usize;
 